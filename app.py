@@ -1,13 +1,18 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import requests
-from scipy.stats import linregress
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import streamlit.components.v1 as components
+from tsdownsample import MinMaxLTTBDownsampler
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from plotly.utils import PlotlyJSONEncoder # 核心修复：引入 Plotly 专用编码器
 
 # --- 1. 页面配置 ---
@@ -21,11 +26,31 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. 数据获取 ---
-@st.cache_data(ttl=3600)
-def get_data(ticker):
+CACHE_DIR = Path.home() / ".cache" / "mcm"
+CACHE_TTL = 3600
+GENESIS_NS = pd.Timestamp("2009-01-03").value
+NS_PER_DAY = 86_400 * 10**9
+GEO_WINDOW = 200
+
+@st.cache_resource(show_spinner=False)
+def _http_session():
+    """CoinGecko 回退共用的连接池；脚本每次 rerun 都会重新执行模块代码，放进 cache_resource 才能跨 rerun 复用连接"""
+    session = requests.Session()
+    # 网关类瞬时错误 (502/503/504) 在同一连接池上短退避重试，不必整次回退失败
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry))
+    session.headers.update({'User-Agent': 'Mozilla/5.0'})
+    return session
+
+def _download(ticker, start=None):
+    """拉取日线收盘价：yfinance 优先，失败时回退 CoinGecko (增量补拉同样回退，否则 Yahoo 不可用时缓存永远停在旧数据)"""
+    # yfinance 导入约 150ms，延迟到真正需要联网时；磁盘缓存命中的冷启动完全不加载
+    import yfinance as yf
     df = pd.DataFrame()
     try:
-        raw = yf.download(ticker, period="max", interval="1d", progress=False)
+        span = dict(start=start) if start is not None else dict(period="max")
+        # 单 ticker 无需 yfinance 内部线程池; session 不注入: yfinance 1.x 只接受 curl_cffi 会话
+        raw = yf.download(ticker, interval="1d", progress=False, threads=False, **span)
         if not raw.empty:
             if isinstance(raw.columns, pd.MultiIndex):
                 try: df = raw.xs('Close', axis=1, level=0, drop_level=True)
@@ -38,86 +63,228 @@ def get_data(ticker):
     if df.empty:
         try:
             coin = "bitcoin" if "BTC" in ticker else "ethereum"
-            url = f"https://api.coingecko.com/api/v3/coins/{coin}/market_chart?vs_currency=usd&days=max&interval=daily"
-            data = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=5).json()
-            df = pd.DataFrame(data['prices'], columns=['ts', 'Close'])
-            df['Date'] = pd.to_datetime(df['ts'], unit='ms')
-            df = df.set_index('Date')[['Close']]
+            url = f"https://api.coingecko.com/api/v3/coins/{coin}/market_chart"
+            # 增量时只取 start 当天以来的天数 (按 UTC 日期算，与日线索引一致)，由调用方按 searchsorted 拼回缓存
+            today = pd.Timestamp.now('UTC').tz_localize(None).normalize()
+            days = "max" if start is None else max((today - pd.Timestamp(start).normalize()).days + 1, 1)
+            params = dict(vs_currency="usd", days=days, interval="daily")
+            data = _http_session().get(url, params=params, timeout=5).json()
+            # [时间戳, 价格] 列表一次性转成 float64 矩阵，按列构造，跳过逐行类型推断
+            prices = np.asarray(data['prices'], dtype=np.float64)
+            # D 日 00:00 UTC 的点是当时的快照，即 D-1 日收盘；最后一个点是当前时刻 (当日未收盘)。
+            # 按 "收盘所在日" 归日：(ms - 1) 向下取整，00:00 落到前一天，盘中点留在当天；
+            # 数据按时间有序，相邻比较即可去重 (同一天只保留最后一个价格)
+            ms = prices[:, 0].astype(np.int64)
+            ms = (ms - 1) // 86_400_000 * 86_400_000
+            last = np.append(ms[1:] != ms[:-1], True)
+            # 毫秒时间戳直接 view 成 datetime64[ms]，不经过 to_datetime 的通用解析
+            dates = pd.DatetimeIndex(ms[last].astype('datetime64[ms]'), name='Date')
+            df = pd.DataFrame({'Close': prices[last, 1]}, index=dates)
         except: return pd.DataFrame()
-    
+
     if df.empty: return df
+    # yfinance 的加密货币日线为 UTC：tz_convert(None) 直接剥离时区 (只换 dtype，不重算 wall time)；CoinGecko 索引本就是 naive
+    if getattr(df.index, 'tz', None) is not None: df.index = df.index.tz_convert(None)
+    # 增量拼接的二分查找、前缀和均线都依赖时间升序；两个数据源本就有序，O(N) 检查后通常不用排序
+    if not df.index.is_monotonic_increasing: df = df.sort_index()
+    return df[['Close']]
 
-    if df.index.tz is not None: df.index = df.index.tz_localize(None)
-    df = df[pd.to_numeric(df['Close'], errors='coerce') > 0]
-    
-    df['GeoMean'] = np.exp(np.log(df['Close']).rolling(200).mean())
-    df['Days'] = (df.index - pd.Timestamp("2009-01-03")).days
-    df = df[df['Days'] > 0].dropna()
+def _cache_path(ticker):
+    return CACHE_DIR / f"{ticker}.parquet"
+
+def _refresh(ticker, cached):
+    """
+    从最后一根 K 线开始补拉增量 (当日 K 线可能未收盘，需覆盖) 并写回磁盘。
+    返回 (数据, 是否已写回)：补拉失败时退回旧缓存；写盘失败时 mtime 不变，调用方需按失败处理
+    """
+    start = cached.index[-1] if not cached.empty else None
+    df = _download(ticker, start)
+    if df.empty: return cached, False
+    if start is not None:
+        # 只用增量覆盖 start 及之后的 K 线 (回退源可能多返回几天，不动 start 之前已收盘的数据)；
+        # 两边索引都有序，二分定位拼接点，切片不复制
+        df = df.iloc[df.index.searchsorted(start):]
+        if df.empty: return cached, False
+        df = pd.concat([cached.iloc[:cached.index.searchsorted(start)], df])
+
+    # 先写临时文件再原子替换，并发读取的一方不会读到写了一半的 parquet
+    tmp = _cache_path(ticker).with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp)
+        tmp.replace(_cache_path(ticker))
+    except:
+        try: tmp.unlink(missing_ok=True)
+        except: pass
+        return df, False
+    return df, True
+
+RETRY_BASE = 60  # 后台刷新失败后的首次重试间隔 (秒)，之后翻倍，最长 CACHE_TTL
+
+@st.cache_resource(show_spinner=False)
+def _refreshing():
+    """
+    后台刷新状态 (跨会话共享)：
+    - pending: 正在刷新的 ticker，同一 ticker 同时只跑一个刷新线程
+    - failures: ticker -> (连续失败次数, 最近失败时间)，用于退避重试和页面提示
+    """
+    return set(), {}, threading.Lock()
+
+def _refresh_in_background(ticker):
+    pending, failures, lock = _refreshing()
+    with lock:
+        if ticker in pending: return
+        n, failed_at = failures.get(ticker, (0, 0.0))
+        # 连续失败时按指数退避，避免每次打开页面都再起一个注定失败的刷新线程
+        if n and time.time() - failed_at < min(RETRY_BASE * 2 ** (n - 1), CACHE_TTL): return
+        pending.add(ticker)
+
+    def run():
+        ok = False
+        try:
+            try: cached = pd.read_parquet(_cache_path(ticker))
+            except: cached = pd.DataFrame()
+            # 下载失败或写盘失败都算失败：文件 mtime 没变，不退避的话每次打开页面都会重来
+            _, ok = _refresh(ticker, cached)
+        finally:
+            with lock:
+                pending.discard(ticker)
+                if ok: failures.pop(ticker, None)
+                else: failures[ticker] = (failures.get(ticker, (0, 0.0))[0] + 1, time.time())
+    threading.Thread(target=run, daemon=True).start()
+
+def _refresh_failed(ticker):
+    """最近一次后台刷新是否失败 (页面据此提示数据可能过期)"""
+    pending, failures, lock = _refreshing()
+    with lock: return ticker in failures
+
+def _cache_version(ticker):
+    """
+    磁盘缓存的版本号 (文件 mtime)，作为 get_data 的缓存键之一 (stale-while-revalidate)：
+    1. 过期时在后台补拉，本次照常用旧数据，不阻塞页面
+    2. 后台写回后 mtime 变化，下一次运行自然读到新数据
+    3. 补拉失败时记录下来并退避重试
+    """
+    try: mtime = _cache_path(ticker).stat().st_mtime
+    except OSError: return None
+    if time.time() - mtime >= CACHE_TTL: _refresh_in_background(ticker)
+    return mtime
+
+def _load_cached(ticker):
+    """磁盘二级缓存 (L1 仍是 st.cache_data)：有缓存文件就直接返回 (过期由 _cache_version 负责后台刷新)，没有才同步拉取"""
+    try: cached = pd.read_parquet(_cache_path(ticker))
+    except: cached = pd.DataFrame()
+    return cached if not cached.empty else _refresh(ticker, cached)[0]
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_data(ticker, version=None):
+    """version 为磁盘缓存的 mtime：后台刷新写回后键随之变化，内存缓存不会压着旧数据"""
+    df = _load_cached(ticker)
+    if df.empty: return df
+
+    # 一次性构造过滤条件 (收盘价有效且 > 0、日期在创世块之后)，避免多次布尔索引复制整表
+    # Days 直接在 int64 纳秒上做整除 (pandas 3 的索引精度不一定是 ns，先统一)
+    # 三个来源 (yfinance / CoinGecko / parquet) 的 Close 都已是数值列，直接取 float64 ndarray；缺失值落成 NaN 由 isfinite 过滤
+    close = df['Close'].to_numpy(dtype=np.float64, na_value=np.nan)
+    days = (df.index.as_unit('ns').asi8 - GENESIS_NS) // NS_PER_DAY
+    index = df.index
+    keep = np.isfinite(close) & (close > 0) & (days > 0)
+    # 常见情况全部有效：跳过三份数组的花式索引拷贝
+    if not keep.all():
+        keep = keep.nonzero()[0]
+        close, days, index = close[keep], days[keep], index[keep]
+
+    if len(close) < GEO_WINDOW: return pd.DataFrame()
+
+    # 200 日几何均线：log 收盘价做一次前缀和，相邻窗口相减即窗口和，不经过 pandas rolling
+    # 只产出完整窗口，前 199 天的预热期随之切掉
+    csum = np.cumsum(np.log(close))
+    geo_mean = np.exp(np.concatenate(([csum[GEO_WINDOW - 1]], csum[GEO_WINDOW:] - csum[:-GEO_WINDOW])) / GEO_WINDOW)
+    warm = slice(GEO_WINDOW - 1, None)
+    close, days, index = close[warm], days[warm], index[warm]
     
+    # log10(Days) 回归与预测共用，只算一次
+    log_days = np.log10(days.astype(np.float64))
     if "BTC" in ticker:
-        df['Predicted'] = 10 ** (5.84 * np.log10(df['Days']) - 17.01)
+        predicted = np.power(10.0, 5.84 * log_days - 17.01)
     else:
-        slope, intercept, _, _, _ = linregress(np.log10(df['Days']), np.log10(df['Close']))
-        df['Predicted'] = 10 ** (intercept + slope * np.log10(df['Days']))
+        log_close = np.log10(close)
+        # 一元最小二乘闭式解，只需要斜率和截距
+        x_mean, y_mean = log_days.mean(), log_close.mean()
+        dx = log_days - x_mean
+        slope = np.dot(dx, log_close - y_mean) / np.dot(dx, dx)
+        intercept = y_mean - slope * x_mean
+        predicted = np.power(10.0, intercept + slope * log_days)
+
+    # AHR999 = (Close / GeoMean) * (Close / Predicted)，在 ndarray 上合并成一次乘除
+    ahr999 = close * close / (geo_mean * predicted)
 
-    df['AHR999'] = (df['Close'] / df['GeoMean']) * (df['Close'] / df['Predicted'])
-    return df
+    # 只返回画图用到的列 (Days、GeoMean 不再带出)；指标列转 float32 减半缓存体积，Close 保留 float64 供标题报价
+    return pd.DataFrame({
+        'Close': close,
+        'Predicted': predicted.astype(np.float32),
+        'AHR999': ahr999.astype(np.float32),
+    }, index=index)
 
 # --- 3. 绘图逻辑 ---
+MAX_POINTS = 1500
+TITLE_TPL = "<b>{ticker}</b>: ${price:,.2f}"
+
+# 指数副图的三条阈值线 (与 add_hline 生成的结构一致)，模块加载时构建一次，布局中一次性赋值
+_ZONES = [(0.45, "#228b22", "BUY"), (1.2, "#4682b4", "ACCUM"), (4.0, "#b22222", "RISK")]
+_LINES = tuple(dict(type="line", xref="x2 domain", yref="y2", x0=0, x1=1, y0=y, y1=y, line=dict(color=c, dash="dot")) for y, c, _ in _ZONES)
+_ANN = tuple(dict(xref="x2 domain", yref="y2", x=0, y=y, xanchor="left", yanchor="bottom", showarrow=False, text=tx, font=dict(color=c, size=10)) for y, c, tx in _ZONES)
+
+def _series(df, col, n_out=MAX_POINTS):
+    """MinMaxLTTB 降采样：保留峰谷形态，只把画布分辨得出的点交给 Plotly (float32 足够屏幕精度)"""
+    # 日线只需日期：x 以 'YYYY-MM-DD' 下发，比默认的完整 ISO 时间戳短一半
+    # (不用 epoch 毫秒数值：plotly.js 会按浏览器本地时区解释数值日期，K 线会偏离 00:00)
+    y = df[col].to_numpy(dtype=np.float32)
+    x = df.index.to_numpy(dtype='datetime64[D]')
+    if len(y) > n_out:
+        idx = MinMaxLTTBDownsampler().downsample(df.index.asi8, y, n_out=n_out)
+        x, y = x[idx], y[idx]
+    return dict(x=np.datetime_as_string(x, unit='D'), y=y)
+
+def _restyle(df):
+    """单个币种三条曲线的 x/y，经 Plotly 自身编码 (数值数组为 base64 typed array)，用作按钮的 restyle 参数"""
+    data = go.Figure([go.Scattergl(**_series(df, c)) for c in ['Close', 'Predicted', 'AHR999']]).to_dict()['data']
+    return {"x": [t['x'] for t in data], "y": [t['y'] for t in data]}
+
 def create_chart(df_btc, df_eth):
-    c_p, c_b, c_a, c_r = "#000000", "#228b22", "#4682b4", "#b22222"
+    c_p = "#000000"
     
     # 1. 创建图表结构
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3], vertical_spacing=0.08)
 
-    # 2. 绘制 BTC (Trace 0, 1, 2)
-    if not df_btc.empty:
-        fig.add_trace(go.Scatter(x=df_btc.index, y=df_btc['Close'], name="BTC Price", line=dict(color=c_p, width=1.5), visible=True), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df_btc.index, y=df_btc['Predicted'], name="BTC Model", line=dict(color="purple", width=1, dash='dash'), visible=True), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df_btc.index, y=df_btc['AHR999'], name="BTC Index", line=dict(color="#d35400", width=1.5), visible=True), row=2, col=1)
-
-    # 3. 绘制 ETH (Trace 3, 4, 5) - 影子轴
-    if not df_eth.empty:
-        fig.add_trace(go.Scatter(x=df_eth.index, y=df_eth['Close'], name="ETH Price", line=dict(color=c_p, width=1.5), yaxis="y3", visible=False)) 
-        fig.add_trace(go.Scatter(x=df_eth.index, y=df_eth['Predicted'], name="ETH Model", line=dict(color="purple", width=1, dash='dash'), yaxis="y3", visible=False))
-        fig.add_trace(go.Scatter(x=df_eth.index, y=df_eth['AHR999'], name="ETH Index", line=dict(color="#d35400", width=1.5), yaxis="y4", visible=False))
+    # 2. 只保留三条曲线 (Trace 0 价格, 1 模型, 2 指数)，初始绑定 BTC，切换币种时 restyle 替换 x/y
+    # 一次 add_traces 提交，子图网格只解析一次
+    fig.add_traces([
+        go.Scattergl(**_series(df_btc, 'Close'), name="Price", line=dict(color=c_p, width=1.5)),
+        go.Scattergl(**_series(df_btc, 'Predicted'), name="Model", line=dict(color="purple", width=1, dash='dash'), hoverinfo='skip'),
+        go.Scattergl(**_series(df_btc, 'AHR999'), name="Index", line=dict(color="#d35400", width=1.5)),
+    ], rows=[1, 1, 2], cols=[1, 1, 1])
 
-    # 4. 背景区域
-    for y_val, c, tx in [(0.45, c_b, "BUY"), (1.2, c_a, "ACCUM"), (4.0, c_r, "RISK")]:
-        fig.add_hline(y=y_val, row=2, col=1, line_dash="dot", line_color=c, annotation_text=tx, annotation_position="top left", annotation_font=dict(color=c, size=10))
+    # 3. 按钮定义
+    t_btc = TITLE_TPL.format(ticker="BTC-USD", price=df_btc['Close'].iat[-1])
+    t_eth = TITLE_TPL.format(ticker="ETH-USD", price=df_eth['Close'].iat[-1]) if not df_eth.empty else "ETH"
 
-    # 5. 按钮定义
-    t_btc = f"<b>BTC-USD</b>: ${df_btc['Close'].iloc[-1]:,.2f}" if not df_btc.empty else "BTC"
-    t_eth = f"<b>ETH-USD</b>: ${df_eth['Close'].iloc[-1]:,.2f}" if not df_eth.empty else "ETH"
-
-    # 注意：这里我们设置 autorange=True，让 JS 接管后的首次重绘能找到基准
+    # 切换后 Y 轴先 autorange，再由 JS 按当前视口收紧
+    # BTC 的数组已在初始 trace 中，其 restyle 参数由前端从 trace 回填，避免同一份数据序列化两次
     btn_btc = dict(
         label="BTC", method="update",
-        args=[
-            {"visible": [True, True, True, False, False, False]},
-            {
-                "title.text": t_btc,
-                "yaxis.visible": True, "yaxis2.visible": True,
-                "yaxis3.visible": False, "yaxis4.visible": False
-            }
-        ]
-    )
-    
-    btn_eth = dict(
-        label="ETH", method="update",
-        args=[
-            {"visible": [False, False, False, True, True, True]},
-            {
-                "title.text": t_eth,
-                "yaxis.visible": False, "yaxis2.visible": False,
-                "yaxis3.visible": True, "yaxis4.visible": True
-            }
-        ]
+        args=[{}, {"title.text": t_btc, "yaxis.autorange": True, "yaxis2.autorange": True}, [0, 1, 2]]
     )
+    buttons = [btn_btc]
+    if not df_eth.empty:
+        buttons.append(dict(
+            label="ETH", method="update",
+            args=[_restyle(df_eth), {"title.text": t_eth, "yaxis.autorange": True, "yaxis2.autorange": True}, [0, 1, 2]]
+        ))
 
-    # 6. 布局配置
+    # 4. 布局配置
     # 全局关闭默认 RangeSelector
-    fig.update_xaxes(rangeselector=dict(visible=False), rangeslider=dict(visible=False), fixedrange=False)
+    fig.update_xaxes(type="date", rangeselector=dict(visible=False), rangeslider=dict(visible=False), fixedrange=False)
     # 底部开启 RangeSlider
     fig.update_xaxes(rangeslider=dict(visible=True, thickness=0.05, bgcolor="#f4f4f4"), row=2, col=1)
 
@@ -127,24 +294,36 @@ def create_chart(df_btc, df_eth):
         margin=dict(t=80, l=40, r=40, b=40),
         title=dict(text=t_btc, x=0.01, y=0.96),
         hovermode="x unified",
+        # 关闭 spike 搜索 (未画 spikeline)；hoverdistance 保持默认 20px，放大后降采样的点间距可达数十像素
+        spikedistance=0,
         showlegend=False,
         dragmode="pan", 
+        # 背景区域 (阈值线)
+        shapes=_LINES, annotations=_ANN,
         
         updatemenus=[dict(
             type="buttons", direction="left", active=0, x=0.01, y=1.08,
-            buttons=[btn_btc, btn_eth], bgcolor="white", bordercolor="#e0e0e0", borderwidth=1
+            buttons=buttons, bgcolor="white", bordercolor="#e0e0e0", borderwidth=1
         )],
         
         # 关键：所有 Y 轴 fixedrange=False，否则无法缩放
         yaxis=dict(domain=[0.35, 1], type="log", title="Price", fixedrange=False),
-        yaxis2=dict(domain=[0, 0.30], type="log", title="Index", fixedrange=False),
-        yaxis3=dict(domain=[0.35, 1], anchor="x", overlaying="y", side="left", type="log", visible=False, showgrid=False, fixedrange=False),
-        yaxis4=dict(domain=[0, 0.30], anchor="x", overlaying="y2", side="left", type="log", visible=False, showgrid=False, fixedrange=False)
+        yaxis2=dict(domain=[0, 0.30], type="log", title="Index", fixedrange=False)
     )
     return fig
 
+def _data_key(df):
+    """图表缓存键：行数 + 末行时间 + 末行收盘价 (当日 K 线盘中会变)，避免对整张表做哈希"""
+    return (len(df), df.index[-1].value, float(df['Close'].iat[-1])) if not df.empty else None
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_figure_json(data_key, _df_btc, _df_eth):
+    """图表 JSON 跨 rerun 复用，数据不变时既不重新组装 Figure 也不重新序列化 (下划线参数不参与哈希; str 不可变, 可安全共享)"""
+    # [核心修复] 使用 PlotlyJSONEncoder 处理 Numpy/Pandas 数据类型
+    return json.dumps(create_chart(_df_btc, _df_eth).to_dict(), cls=PlotlyJSONEncoder)
+
 # --- 4. 核心组件：带 JS 自动缩放的图表渲染 ---
-def st_plotly_autoscaling(fig):
+def st_plotly_autoscaling(plot_json):
     """
     使用 JavaScript 注入实现：
     1. 渲染 Plotly 图表
@@ -153,14 +332,11 @@ def st_plotly_autoscaling(fig):
     4. 自动更新 Y 轴范围
     """
     
-    # [核心修复] 使用 PlotlyJSONEncoder 处理 Numpy/Pandas 数据类型
-    plot_json = json.dumps(fig.to_dict(), cls=PlotlyJSONEncoder)
-    
     html_code = f"""
     <!DOCTYPE html>
     <html>
     <head>
-        <script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>
+        <script src="https://cdn.plot.ly/plotly-2.35.2.min.js"></script>
         <style>
             body {{ margin: 0; }}
             .modebar {{ display: none !important; }}
@@ -170,6 +346,13 @@ def st_plotly_autoscaling(fig):
         <div id="myDiv" style="height: 700px; width: 100%;"></div>
         <script>
             var plotData = {plot_json};
+
+            // BTC 按钮的 restyle 参数回填为初始 trace 的 x/y (Python 端未重复序列化)
+            var btcArgs = plotData.layout.updatemenus[0].buttons[0].args;
+            btcArgs[0] = {{
+                x: plotData.data.map(function(t) {{ return t.x; }}),
+                y: plotData.data.map(function(t) {{ return t.y; }})
+            }};
             
             // 初始化图表
             Plotly.newPlot('myDiv', plotData.data, plotData.layout, {{responsive: true, displayModeBar: false, scrollZoom: true}});
@@ -177,89 +360,89 @@ def st_plotly_autoscaling(fig):
             var graphDiv = document.getElementById('myDiv');
             var relayoutTimer;
 
+            // 根据当前 X 轴视口收紧 Y 轴
+            // Trace 0 价格 (yaxis), Trace 2 指数 (yaxis2)；切换币种时三条 trace 的数据整体被替换
+            function rescaleY() {{
+                var xrange = graphDiv.layout.xaxis.range;
+                if (!xrange) return;
+                // 视口边界用轴自身的换算转成 epoch 毫秒 (UTC)，与 x 数据同一刻度
+                var xa = graphDiv._fullLayout.xaxis;
+                var xMin = xa.r2l(xrange[0]);
+                var xMax = xa.r2l(xrange[1]);
+
+                // 辅助函数：计算局部 Min/Max
+                // 读 _fullData：base64 typed array 已由 Plotly 解码
+                function getRange(traceIndex) {{
+                    var xData = graphDiv._fullData[traceIndex].x;
+                    var yData = graphDiv._fullData[traceIndex].y;
+                    var minVal = Infinity;
+                    var maxVal = -Infinity;
+                    var hasData = false;
+
+                    for (var i = 0; i < xData.length; i++) {{
+                        var xVal = Date.parse(xData[i]); // 纯日期串按 UTC 解析，与 r2l 同一刻度
+                        if (xVal >= xMin && xVal <= xMax) {{
+                            var yVal = yData[i];
+                            if (yVal > 0) {{ // Log 轴不能有 0 或负数
+                                if (yVal < minVal) minVal = yVal;
+                                if (yVal > maxVal) maxVal = yVal;
+                                hasData = true;
+                            }}
+                        }}
+                    }}
+                    return hasData ? [minVal, maxVal] : null;
+                }}
+                
+                // 计算新范围
+                var priceRange = getRange(0);
+                var indexRange = getRange(2);
+                
+                var update = {{}};
+                
+                // 更新价格轴
+                if (priceRange) {{
+                    var logMin = Math.log10(priceRange[0]);
+                    var logMax = Math.log10(priceRange[1]);
+                    var pad = (logMax - logMin) * 0.1; // 10% 留白
+                    if (pad === 0) pad = 0.1;
+                    update['yaxis.range'] = [logMin - pad, logMax + pad];
+                }}
+                
+                // 更新指数轴 (可选：如果你希望下方的 Index 也自动缩放，取消注释下面代码)
+                /*
+                if (indexRange) {{
+                    var logMinI = Math.log10(indexRange[0]);
+                    var logMaxI = Math.log10(indexRange[1]);
+                    var padI = (logMaxI - logMinI) * 0.1;
+                    if (padI === 0) padI = 0.1;
+                    update['yaxis2.range'] = [logMinI - padI, logMaxI + padI];
+                }}
+                */
+
+                // 执行更新
+                if (Object.keys(update).length > 0) {{
+                    Plotly.relayout(graphDiv, update);
+                }}
+            }}
+
             // 监听布局变化 (缩放/平移)
             graphDiv.on('plotly_relayout', function(eventdata){{
-                // 如果事件是由 Y 轴变化触发的，忽略之，防止死循环
-                if (eventdata["yaxis.range[0]"] || eventdata["yaxis3.range[0]"] || eventdata["yaxis2.range[0]"]) return;
-                
-                // 获取当前的 X 轴范围
-                var xrange = graphDiv.layout.xaxis.range;
+                // 只涉及 Y 轴的事件 (包括 rescaleY 自己触发的 relayout) 忽略之，防止死循环
+                var keys = Object.keys(eventdata);
+                if (keys.every(function(k) {{ return k.indexOf('yaxis') === 0; }})) return;
                 
                 // 如果是 Autorange (双击重置)，不需要计算，Plotly 会自动处理
-                if (!xrange || eventdata["xaxis.autorange"]) return;
+                if (eventdata["xaxis.autorange"]) return;
 
                 // 防抖动：等待 50ms 后再计算，避免拖拽时计算过于频繁
                 clearTimeout(relayoutTimer);
-                relayoutTimer = setTimeout(function(){{
-                    var xMin = new Date(xrange[0]).getTime();
-                    var xMax = new Date(xrange[1]).getTime();
-                    
-                    // 判断当前显示的是 BTC (trace 0) 还是 ETH (trace 3)
-                    // Plotly 中 trace 0,1,2 是 BTC; 3,4,5 是 ETH
-                    var isBTC = graphDiv.data[0].visible !== false;
-                    
-                    // 定义我们要计算的 trace 索引和对应的 Y 轴名称
-                    // 我们分别计算 Price (y/y3) 和 Index (y2/y4)
-                    var priceTraceIdx = isBTC ? 0 : 3;
-                    var indexTraceIdx = isBTC ? 2 : 5;
-                    
-                    var yPriceName = isBTC ? 'yaxis' : 'yaxis3';
-                    var yIndexName = isBTC ? 'yaxis2' : 'yaxis4';
-                    
-                    // 辅助函数：计算局部 Min/Max
-                    function getRange(traceIndex) {{
-                        var xData = graphDiv.data[traceIndex].x;
-                        var yData = graphDiv.data[traceIndex].y;
-                        var minVal = Infinity;
-                        var maxVal = -Infinity;
-                        var hasData = false;
-
-                        for (var i = 0; i < xData.length; i++) {{
-                            var xVal = new Date(xData[i]).getTime();
-                            if (xVal >= xMin && xVal <= xMax) {{
-                                var yVal = yData[i];
-                                if (yVal > 0) {{ // Log 轴不能有 0 或负数
-                                    if (yVal < minVal) minVal = yVal;
-                                    if (yVal > maxVal) maxVal = yVal;
-                                    hasData = true;
-                                }}
-                            }}
-                        }}
-                        return hasData ? [minVal, maxVal] : null;
-                    }}
-                    
-                    // 计算新范围
-                    var priceRange = getRange(priceTraceIdx);
-                    var indexRange = getRange(indexTraceIdx);
-                    
-                    var update = {{}};
-                    
-                    // 更新价格轴
-                    if (priceRange) {{
-                        var logMin = Math.log10(priceRange[0]);
-                        var logMax = Math.log10(priceRange[1]);
-                        var pad = (logMax - logMin) * 0.1; // 10% 留白
-                        if (pad === 0) pad = 0.1;
-                        update[yPriceName + '.range'] = [logMin - pad, logMax + pad];
-                    }}
-                    
-                    // 更新指数轴 (可选：如果你希望下方的 Index 也自动缩放，取消注释下面代码)
-                    /*
-                    if (indexRange) {{
-                        var logMinI = Math.log10(indexRange[0]);
-                        var logMaxI = Math.log10(indexRange[1]);
-                        var padI = (logMaxI - logMinI) * 0.1;
-                        if (padI === 0) padI = 0.1;
-                        update[yIndexName + '.range'] = [logMinI - padI, logMaxI + padI];
-                    }}
-                    */
+                relayoutTimer = setTimeout(rescaleY, 50);
+            }});
 
-                    // 执行更新
-                    if (Object.keys(update).length > 0) {{
-                        Plotly.relayout(graphDiv, update);
-                    }}
-                    
-                }}, 50);
+            // 切换币种 (按钮触发 Plotly.update) 后按当前视口重算
+            graphDiv.on('plotly_update', function(){{
+                clearTimeout(relayoutTimer);
+                relayoutTimer = setTimeout(rescaleY, 50);
             }});
         </script>
     </body>
@@ -271,10 +454,17 @@ def st_plotly_autoscaling(fig):
 # --- 5. 主程序 ---
 st.title("Market Cycle Monitor")
 with st.spinner("Syncing data..."):
-    btc_df, eth_df = get_data("BTC-USD"), get_data("ETH-USD")
+    # 两个币种的下载互不依赖，并发拉取，冷启动耗时取决于较慢的一方
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        tickers = ["BTC-USD", "ETH-USD"]
+        btc_df, eth_df = ex.map(get_data, tickers, [_cache_version(t) for t in tickers])
+
+for t, df in zip(tickers, (btc_df, eth_df)):
+    if not df.empty and _refresh_failed(t):
+        st.warning(f"{t}: refresh failed, showing cached data through {df.index[-1]:%Y-%m-%d}")
 
 if not btc_df.empty:
-    fig = create_chart(btc_df, eth_df)
-    st_plotly_autoscaling(fig)
+    plot_json = build_figure_json((_data_key(btc_df), _data_key(eth_df)), btc_df, eth_df)
+    st_plotly_autoscaling(plot_json)
 else:
     st.error("Data Load Failed")